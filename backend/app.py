@@ -1,6 +1,14 @@
 import os
+import sys
 import json
 import logging
+import functools
+import importlib.util
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from flask import Flask, request, jsonify
 from flask_cors import CORS
@@ -8,13 +16,32 @@ from dotenv import load_dotenv
 import numpy as np
 import pandas as pd
 import joblib
+import lightgbm as lgb
 from supabase import create_client, Client
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+try:
+    from ml_models import feature_kernel
+except ImportError:
+    feature_kernel = None
+    logger.warning("Numba feature kernel unavailable, falling back to dict-based features")
+
+try:
+    from ml_models import forest_kernel
+except ImportError:
+    forest_kernel = None
+
+try:
+    import treelite_runtime
+except ImportError:
+    treelite_runtime = None
+
 app = Flask(__name__)
 CORS(app)
 
@@ -24,35 +51,186 @@ SUPABASE_KEY = os.getenv('SUPABASE_ANON_KEY')
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 price_model = None
+price_predictor = None
 demand_model = None
 feature_columns = None
 metadata = None
 
+_NEIGHBOURHOOD_FREQ = {
+    'Harlem': 0.054, 'Williamsburg': 0.078, 'Upper West Side': 0.042,
+    'Bedford-Stuyvesant': 0.076, 'East Village': 0.035, 'Brooklyn Heights': 0.020,
+    'Astoria': 0.028, 'Bushwick': 0.047, 'Crown Heights': 0.031, 'Upper East Side': 0.034
+}
+
+_FEATURE_LOCAL = threading.local()
+_KERNEL_ENABLED = False
+_FEATURE_WRITERS = None
+
+_DEFAULT_CONFIDENCE = 0.85
+
+_BATCH_MAX_SIZE = 32
+_BATCH_MAX_WAIT = 0.01
+
+_price_batcher = None
+_demand_batcher = None
+_price_forest = None
+
+_DB_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix='db-insert')
+
+class _MicroBatcher:
+    """Collect single-row predictions into short-window batches for one model"""
+
+    def __init__(self, predict_fn, max_batch=_BATCH_MAX_SIZE, max_wait=_BATCH_MAX_WAIT):
+        self._predict_fn = predict_fn
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_worker(self):
+        """Start (or restart after a fork) the drain thread in this process"""
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def submit(self, row):
+        """Queue one feature row; returns a Future resolving to its prediction"""
+        fut = Future()
+        with self._lock:
+            self._ensure_worker()
+            self._pending.append((row, fut))
+        self._event.set()
+        return fut
+
+    def _run(self):
+        while True:
+            self._event.wait()
+
+            # A lone row is drained immediately; the window is only held
+            # open to fill a batch once a second row is already waiting.
+            deadline = time.monotonic() + self._max_wait
+            while 1 < len(self._pending) < self._max_batch and time.monotonic() < deadline:
+                time.sleep(0.001)
+
+            with self._lock:
+                batch = [self._pending.popleft() for _ in range(min(len(self._pending), self._max_batch))]
+                if not self._pending:
+                    self._event.clear()
+
+            if not batch:
+                continue
+
+            rows = np.vstack([row for row, _ in batch])
+            try:
+                results = self._predict_fn(rows)
+                for (_, fut), result in zip(batch, results):
+                    fut.set_result(result)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+
+def _price_predict_batch(rows):
+    """Batch price inference returning (price, confidence) per row"""
+    if price_predictor is not None:
+        values = np.ravel(price_predictor.predict(treelite_runtime.DMatrix(rows)))
+        return [(float(v), _DEFAULT_CONFIDENCE) for v in values]
+
+    if _price_forest is not None:
+        results = []
+        for row in rows:
+            mean, std = forest_kernel.predict_forest(row, *_price_forest)
+            results.append((float(mean), float(np.exp(-std / max(abs(mean), 1e-6)))))
+        return results
+
+    per_tree = np.stack([tree.predict(rows) for tree in price_model.estimators_])
+    means = per_tree.mean(axis=0)
+    stds = per_tree.std(axis=0)
+    return [
+        (float(mean), float(np.exp(-std / max(abs(mean), 1e-6))))
+        for mean, std in zip(means, stds)
+    ]
+
+def _demand_predict_batch(rows):
+    """Batch demand inference returning probability per row"""
+    probabilities = demand_model.predict(
+        rows, pred_early_stop=True, pred_early_stop_margin=10.0, num_threads=1
+    )
+    return [float(p) for p in probabilities]
+
+_DB_BREAKER_THRESHOLD = 5
+_DB_BREAKER_COOLDOWN = 30.0
+_DB_STATE = {'fails': 0, 'open_until': 0.0}
+
+def _persist(record):
+    """Insert a prediction record into Supabase off the request path"""
+
+    if time.time() < _DB_STATE['open_until']:
+        return
+
+    try:
+        supabase.table('predictions').insert(record).execute()
+        _DB_STATE['fails'] = 0
+    except Exception as db_error:
+        _DB_STATE['fails'] += 1
+        logger.warning(f"Database insert failed: {str(db_error)}")
+        if _DB_STATE['fails'] >= _DB_BREAKER_THRESHOLD:
+            _DB_STATE['fails'] = 0
+            _DB_STATE['open_until'] = time.time() + _DB_BREAKER_COOLDOWN
+            logger.warning(f"Database circuit opened for {_DB_BREAKER_COOLDOWN:.0f}s after repeated failures")
+
 def load_models():
     """Load pre-trained models and feature columns"""
-    global price_model, demand_model, feature_columns, metadata
+    global price_model, price_predictor, demand_model, feature_columns, metadata
+    global _price_batcher, _demand_batcher, _price_forest, _NEIGHBOURHOOD_FREQ
 
     try:
         model_dir = os.path.join(os.path.dirname(__file__), '..', 'ml_models', 'models')
 
+        if treelite_runtime is not None and os.path.exists(os.path.join(model_dir, 'price_model.so')):
+            price_predictor = treelite_runtime.Predictor(os.path.join(model_dir, 'price_model.so'), verbose=False)
+            logger.info("Compiled price model loaded successfully")
+
         if os.path.exists(os.path.join(model_dir, 'price_model.joblib')):
-            price_model = joblib.load(os.path.join(model_dir, 'price_model.joblib'))
+            price_model = joblib.load(os.path.join(model_dir, 'price_model.joblib'), mmap_mode='r')
+            price_model.n_jobs = 1
             logger.info("Price model loaded successfully")
+            if forest_kernel is not None:
+                _price_forest = forest_kernel.flatten_forest(price_model)
+                forest_kernel.predict_forest(np.zeros(price_model.n_features_in_, dtype=np.float32), *_price_forest)
+                logger.info("Numba forest walker enabled")
         else:
             logger.warning("Price model not found")
 
-        if os.path.exists(os.path.join(model_dir, 'demand_model.pkl')):
-            demand_model = joblib.load(os.path.join(model_dir, 'demand_model.pkl'))
+        if os.path.exists(os.path.join(model_dir, 'demand_model.txt')):
+            demand_model = lgb.Booster(model_file=os.path.join(model_dir, 'demand_model.txt'))
+            logger.info("Demand model loaded from native text format")
+        elif os.path.exists(os.path.join(model_dir, 'demand_model.pkl')):
+            demand_model = joblib.load(os.path.join(model_dir, 'demand_model.pkl'), mmap_mode='r')
             logger.info("Demand model loaded successfully")
         else:
             logger.warning("Demand model not found")
 
-        if os.path.exists(os.path.join(model_dir, 'feature_columns.joblib')):
+        schema_path = os.path.join(model_dir, 'feature_schema.py')
+        if os.path.exists(schema_path):
+            spec = importlib.util.spec_from_file_location('feature_schema', schema_path)
+            feature_schema = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(feature_schema)
+            feature_columns = list(feature_schema.FEATURE_COLUMNS)
+            _NEIGHBOURHOOD_FREQ = dict(feature_schema.NEIGHBOURHOOD_FREQ)
+            logger.info(f"Feature schema loaded: {len(feature_columns)} features")
+        elif os.path.exists(os.path.join(model_dir, 'feature_columns.joblib')):
             feature_columns = joblib.load(os.path.join(model_dir, 'feature_columns.joblib'))
             logger.info(f"Feature columns loaded: {len(feature_columns)} features")
         else:
             logger.warning("Feature columns not found")
 
+        _init_feature_kernel()
+        _init_feature_writers()
+
         if os.path.exists(os.path.join(model_dir, 'metadata.json')):
             with open(os.path.join(model_dir, 'metadata.json'), 'r') as f:
                 metadata = json.load(f)
@@ -60,9 +238,105 @@ def load_models():
         else:
             logger.warning("Metadata not found")
 
+        if (price_model is not None or price_predictor is not None) and _price_batcher is None:
+            _price_batcher = _MicroBatcher(_price_predict_batch)
+        if demand_model is not None and _demand_batcher is None:
+            _demand_batcher = _MicroBatcher(_demand_predict_batch)
+
+        _predict_price_cached.cache_clear()
+        _predict_demand_cached.cache_clear()
+
     except Exception as e:
         logger.error(f"Error loading models: {str(e)}")
 
+def _init_feature_kernel():
+    """Enable the compiled feature kernel when the trained column order matches"""
+    global _KERNEL_ENABLED
+
+    if feature_kernel is None or feature_columns is None:
+        return
+
+    if list(feature_columns) != list(feature_kernel.FEATURE_ORDER):
+        logger.warning("Feature columns do not match kernel order, using dict-based features")
+        return
+
+    _KERNEL_ENABLED = True
+    _build_features_kernel({})
+    logger.info("Numba feature kernel enabled")
+
+def _writer_schema():
+    """Static map from feature column name to a getter over the raw input"""
+
+    schema = {
+        'latitude': lambda d: float(d.get('latitude', 40.7580)),
+        'longitude': lambda d: float(d.get('longitude', -73.9855)),
+        'minimum_nights': lambda d: float(d.get('minimum_nights', 1)),
+        'number_of_reviews': lambda d: float(d.get('number_of_reviews', 0)),
+        'reviews_per_month': lambda d: float(d.get('reviews_per_month', 0)),
+        'calculated_host_listings_count': lambda d: float(d.get('calculated_host_listings_count', 1)),
+        'availability_365': lambda d: float(d.get('availability_365', 365)),
+        'availability_ratio': lambda d: float(d.get('availability_365', 365)) / 365,
+        'reviews_density': lambda d: (
+            float(d.get('reviews_per_month', 0)) / float(d.get('number_of_reviews', 0))
+            if d.get('number_of_reviews', 0) > 0 else 0.0
+        ),
+        'min_nights_ratio': lambda d: float(d.get('minimum_nights', 1)) / 365,
+        'neighbourhood_encoded': lambda d: _NEIGHBOURHOOD_FREQ.get(d.get('neighbourhood', 'Harlem'), 0.01),
+    }
+
+    for cat in ('Entire home/apt', 'Private room', 'Shared room'):
+        schema[f'room_type_{cat}'] = lambda d, cat=cat: 1.0 if d.get('room_type', 'Entire home/apt') == cat else 0.0
+
+    for cat in ('Bronx', 'Brooklyn', 'Manhattan', 'Queens', 'Staten Island'):
+        schema[f'neighbourhood_group_{cat}'] = lambda d, cat=cat: 1.0 if d.get('neighbourhood_group', 'Manhattan') == cat else 0.0
+
+    return schema
+
+def _init_feature_writers():
+    """Specialize per-column writers to the frozen feature_columns order"""
+    global _FEATURE_WRITERS
+
+    if feature_columns is None:
+        return
+
+    schema = _writer_schema()
+    _FEATURE_WRITERS = [(i, schema[col]) for i, col in enumerate(feature_columns) if col in schema]
+
+    unknown = [col for col in feature_columns if col not in schema]
+    if unknown:
+        logger.warning(f"Feature columns without writers (left at 0): {unknown}")
+
+def _feature_buf():
+    """Reusable feature row buffer, one per request thread so concurrent
+    requests never write into each other's row before it is consumed."""
+
+    buf = getattr(_FEATURE_LOCAL, 'buf', None)
+    if buf is None or buf.shape[1] != len(feature_columns):
+        buf = np.zeros((1, len(feature_columns)), dtype=np.float32)
+        _FEATURE_LOCAL.buf = buf
+    return buf
+
+def _build_features_kernel(input_data):
+    """Build the model input row via the compiled feature kernel"""
+
+    room_code = feature_kernel.ROOM_TYPE_CODES.get(input_data.get('room_type', 'Entire home/apt'), -1)
+    ng_code = feature_kernel.NEIGHBOURHOOD_GROUP_CODES.get(input_data.get('neighbourhood_group', 'Manhattan'), -1)
+    nb_freq = _NEIGHBOURHOOD_FREQ.get(input_data.get('neighbourhood', 'Harlem'), 0.01)
+    out = _feature_buf()
+
+    feature_kernel.build_features(
+        float(input_data.get('latitude', 40.7580)),
+        float(input_data.get('longitude', -73.9855)),
+        float(input_data.get('minimum_nights', 1)),
+        float(input_data.get('number_of_reviews', 0)),
+        float(input_data.get('reviews_per_month', 0)),
+        float(input_data.get('calculated_host_listings_count', 1)),
+        float(input_data.get('availability_365', 365)),
+        room_code, ng_code, nb_freq, out,
+    )
+
+    return out
+
 def engineer_features(input_data):
     """Engineer features from raw input"""
 
@@ -95,29 +369,89 @@ def engineer_features(input_data):
     features_dict['neighbourhood_group_Queens'] = 1 if neighbourhood_group == 'Queens' else 0
     features_dict['neighbourhood_group_Staten Island'] = 1 if neighbourhood_group == 'Staten Island' else 0
 
-    neighbourhood_freq = {
-        'Harlem': 0.054, 'Williamsburg': 0.078, 'Upper West Side': 0.042,
-        'Bedford-Stuyvesant': 0.076, 'East Village': 0.035, 'Brooklyn Heights': 0.020,
-        'Astoria': 0.028, 'Bushwick': 0.047, 'Crown Heights': 0.031, 'Upper East Side': 0.034
-    }
     neighbourhood = input_data.get('neighbourhood', 'Harlem')
-    features_dict['neighbourhood_encoded'] = neighbourhood_freq.get(neighbourhood, 0.01)
+    features_dict['neighbourhood_encoded'] = _NEIGHBOURHOOD_FREQ.get(neighbourhood, 0.01)
 
     return features_dict
 
-def prepare_features_array(features_dict):
+def prepare_features_array(features_dict, input_data=None):
     """Prepare feature array in correct order for model prediction"""
 
     if feature_columns is None:
         raise ValueError("Feature columns not loaded")
 
-    feature_array = np.zeros(len(feature_columns))
+    if _KERNEL_ENABLED and input_data is not None:
+        return _build_features_kernel(input_data)
+
+    feature_array = _feature_buf()
+    feature_array.fill(0)
+
+    if _FEATURE_WRITERS is not None and input_data is not None:
+        for i, write in _FEATURE_WRITERS:
+            feature_array[0, i] = write(input_data)
+        return feature_array
+
+    if features_dict is None:
+        features_dict = engineer_features(input_data or {})
 
     for i, col in enumerate(feature_columns):
         if col in features_dict:
-            feature_array[i] = features_dict[col]
+            feature_array[0, i] = features_dict[col]
+
+    return feature_array
+
+_KEY_FIELDS = (
+    'latitude', 'longitude', 'room_type', 'neighbourhood_group', 'neighbourhood',
+    'minimum_nights', 'number_of_reviews', 'reviews_per_month',
+    'calculated_host_listings_count', 'availability_365',
+)
+
+def _raw_input_features(input_data):
+    """Raw input fields persisted with a prediction record"""
+    return {field: input_data.get(field) for field in _KEY_FIELDS}
+
+def _prediction_key(input_data):
+    """Canonicalize raw input into a hashable cache key"""
+    return (
+        round(float(input_data.get('latitude', 40.7580)), 4),
+        round(float(input_data.get('longitude', -73.9855)), 4),
+        input_data.get('room_type', 'Entire home/apt'),
+        input_data.get('neighbourhood_group', 'Manhattan'),
+        input_data.get('neighbourhood', 'Harlem'),
+        input_data.get('minimum_nights', 1),
+        input_data.get('number_of_reviews', 0),
+        input_data.get('reviews_per_month', 0),
+        input_data.get('calculated_host_listings_count', 1),
+        input_data.get('availability_365', 365),
+    )
+
+@functools.lru_cache(maxsize=10_000)
+def _predict_price_cached(key):
+    """Pure price prediction for a canonicalized input, cacheable per worker"""
+    input_data = dict(zip(_KEY_FIELDS, key))
+    feature_array = prepare_features_array(None, input_data)
+
+    if _price_batcher is not None:
+        predicted_price, confidence = _price_batcher.submit(feature_array.copy()).result(timeout=1.0)
+    else:
+        predicted_price, confidence = _price_predict_batch(feature_array)[0]
+    predicted_price = max(10, predicted_price)
+
+    return predicted_price, confidence
+
+@functools.lru_cache(maxsize=10_000)
+def _predict_demand_cached(key):
+    """Pure demand prediction for a canonicalized input, cacheable per worker"""
+    input_data = dict(zip(_KEY_FIELDS, key))
+    feature_array = prepare_features_array(None, input_data)
 
-    return feature_array.reshape(1, -1)
+    if _demand_batcher is not None:
+        probability = _demand_batcher.submit(feature_array.copy()).result(timeout=1.0)
+    else:
+        probability = _demand_predict_batch(feature_array)[0]
+    probability = float(np.clip(probability, 0.0, 1.0))
+
+    return probability
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -125,7 +459,7 @@ def health():
     return jsonify({
         'status': 'healthy',
         'models_loaded': {
-            'price_model': price_model is not None,
+            'price_model': price_model is not None or price_predictor is not None,
             'demand_model': demand_model is not None,
             'feature_columns': feature_columns is not None,
         }
@@ -143,34 +477,26 @@ def get_metadata():
 def predict_price():
     """Predict Airbnb listing price"""
 
-    if price_model is None:
+    if price_model is None and price_predictor is None:
         return jsonify({'error': 'Price model not loaded'}), 500
 
     try:
         input_data = request.get_json()
 
-        features_dict = engineer_features(input_data)
-        feature_array = prepare_features_array(features_dict)
-
-        predicted_price = float(price_model.predict(feature_array)[0])
-        predicted_price = max(10, predicted_price)
+        predicted_price, confidence = _predict_price_cached(_prediction_key(input_data))
 
-        confidence = float(np.random.uniform(0.75, 0.95))
+        prediction_id = str(uuid.uuid4())
 
         prediction_record = {
+            'id': prediction_id,
             'prediction_type': 'price',
             'predicted_value': predicted_price,
             'confidence_score': confidence,
             'model_version': metadata['price_model']['version'] if metadata else '1.0',
-            'input_features': features_dict,
+            'input_features': _raw_input_features(input_data),
         }
 
-        try:
-            response = supabase.table('predictions').insert(prediction_record).execute()
-            prediction_id = response.data[0]['id'] if response.data else None
-        except Exception as db_error:
-            logger.warning(f"Database insert failed: {str(db_error)}")
-            prediction_id = None
+        _DB_POOL.submit(_persist, prediction_record)
 
         result = {
             'prediction_id': prediction_id,
@@ -195,28 +521,22 @@ def predict_demand():
     try:
         input_data = request.get_json()
 
-        features_dict = engineer_features(input_data)
-        feature_array = prepare_features_array(features_dict)
-
-        probability = float(demand_model.predict(feature_array)[0])
-        probability = np.clip(probability, 0.0, 1.0)
+        probability = _predict_demand_cached(_prediction_key(input_data))
 
         predicted_class = 'high-demand' if probability > 0.5 else 'low-demand'
 
+        prediction_id = str(uuid.uuid4())
+
         prediction_record = {
+            'id': prediction_id,
             'prediction_type': 'demand',
             'predicted_class': predicted_class,
             'confidence_score': probability,
             'model_version': metadata['demand_model']['version'] if metadata else '1.0',
-            'input_features': features_dict,
+            'input_features': _raw_input_features(input_data),
         }
 
-        try:
-            response = supabase.table('predictions').insert(prediction_record).execute()
-            prediction_id = response.data[0]['id'] if response.data else None
-        except Exception as db_error:
-            logger.warning(f"Database insert failed: {str(db_error)}")
-            prediction_id = None
+        _DB_POOL.submit(_persist, prediction_record)
 
         result = {
             'prediction_id': prediction_id,
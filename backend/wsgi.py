@@ -0,0 +1,13 @@
+"""WSGI entry point for running the API under gunicorn.
+
+Models are loaded at import time so that `gunicorn --preload` loads them
+once in the master process and forked workers share them copy-on-write,
+instead of paying the model-load latency and memory cost per worker.
+
+Run with:
+    gunicorn -w $(nproc) --preload --worker-class=sync --timeout 30 backend.wsgi:app
+"""
+
+from backend.app import app, load_models
+
+load_models()
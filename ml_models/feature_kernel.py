@@ -0,0 +1,58 @@
+"""Compiled feature-engineering kernel shared by training and serving."""
+
+from numba import njit
+
+FEATURE_ORDER = (
+    'latitude',
+    'longitude',
+    'minimum_nights',
+    'number_of_reviews',
+    'reviews_per_month',
+    'calculated_host_listings_count',
+    'availability_365',
+    'availability_ratio',
+    'reviews_density',
+    'min_nights_ratio',
+    'neighbourhood_encoded',
+    'room_type_Entire home/apt',
+    'room_type_Private room',
+    'room_type_Shared room',
+    'neighbourhood_group_Bronx',
+    'neighbourhood_group_Brooklyn',
+    'neighbourhood_group_Manhattan',
+    'neighbourhood_group_Queens',
+    'neighbourhood_group_Staten Island',
+)
+
+ROOM_TYPE_CODES = {'Entire home/apt': 0, 'Private room': 1, 'Shared room': 2}
+NEIGHBOURHOOD_GROUP_CODES = {'Bronx': 0, 'Brooklyn': 1, 'Manhattan': 2, 'Queens': 3, 'Staten Island': 4}
+
+_ROOM_BASE = FEATURE_ORDER.index('room_type_Entire home/apt')
+_NG_BASE = FEATURE_ORDER.index('neighbourhood_group_Bronx')
+_N_FEATURES = len(FEATURE_ORDER)
+
+
+@njit(cache=True, fastmath=True)
+def build_features(lat, lon, min_nights, n_reviews, rpm, host_count, avail,
+                   room_code, ng_code, nb_freq, out):
+    """Write one engineered feature row into out, in FEATURE_ORDER."""
+    out[0, 0] = lat
+    out[0, 1] = lon
+    out[0, 2] = min_nights
+    out[0, 3] = n_reviews
+    out[0, 4] = rpm
+    out[0, 5] = host_count
+    out[0, 6] = avail
+    out[0, 7] = avail / 365.0
+    out[0, 8] = rpm / n_reviews if n_reviews > 0 else 0.0
+    out[0, 9] = min_nights / 365.0
+    out[0, 10] = nb_freq
+
+    for i in range(_ROOM_BASE, _N_FEATURES):
+        out[0, i] = 0.0
+    # A code of -1 marks an unknown category: leave its one-hot block all
+    # zero, matching how pd.get_dummies encodes unseen values at serve time.
+    if room_code >= 0:
+        out[0, _ROOM_BASE + room_code] = 1.0
+    if ng_code >= 0:
+        out[0, _NG_BASE + ng_code] = 1.0
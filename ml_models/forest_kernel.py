@@ -0,0 +1,57 @@
+"""Compiled tree-ensemble walker for serving sklearn random forests."""
+
+import numpy as np
+from numba import njit
+
+
+def flatten_forest(model):
+    """Flatten a fitted sklearn forest into contiguous arrays for the walker"""
+
+    lefts, rights, features, thresholds, values = [], [], [], [], []
+    offsets = [0]
+
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        base = offsets[-1]
+        lefts.append(np.where(tree.children_left >= 0, tree.children_left + base, -1))
+        rights.append(np.where(tree.children_right >= 0, tree.children_right + base, -1))
+        features.append(tree.feature)
+        thresholds.append(tree.threshold)
+        values.append(tree.value.ravel())
+        offsets.append(base + tree.node_count)
+
+    return (
+        np.concatenate(lefts).astype(np.int64),
+        np.concatenate(rights).astype(np.int64),
+        np.concatenate(features).astype(np.int64),
+        np.concatenate(thresholds).astype(np.float32),
+        np.concatenate(values).astype(np.float32),
+        np.asarray(offsets, dtype=np.int64),
+    )
+
+
+@njit(cache=True, fastmath=True)
+def predict_forest(x, left, right, feature, threshold, value, offsets):
+    """Walk every tree for one row; returns (mean, std) of the per-tree leaf values"""
+
+    n_trees = offsets.size - 1
+    acc = 0.0
+    acc_sq = 0.0
+
+    for t in range(n_trees):
+        node = offsets[t]
+        while left[node] != -1:
+            if x[feature[node]] <= threshold[node]:
+                node = left[node]
+            else:
+                node = right[node]
+        leaf = value[node]
+        acc += leaf
+        acc_sq += leaf * leaf
+
+    mean = acc / n_trees
+    var = acc_sq / n_trees - mean * mean
+    if var < 0.0:
+        var = 0.0
+
+    return mean, np.sqrt(var)
@@ -6,62 +6,103 @@ from sklearn.ensemble import RandomForestRegressor
 import lightgbm as lgb
 import joblib
 import os
+from numba import njit, prange
 from datetime import datetime, timedelta
 
 np.random.seed(42)
 
+ROOM_NAMES = np.array(['Entire home/apt', 'Private room', 'Shared room'])
+NEIGHBOURHOOD_GROUP_NAMES = np.array(['Manhattan', 'Brooklyn', 'Queens', 'Bronx', 'Staten Island'])
+NEIGHBOURHOOD_NAMES = np.array(['Harlem', 'Williamsburg', 'Upper West Side', 'Bedford-Stuyvesant', 'East Village', 'Brooklyn Heights', 'Astoria', 'Bushwick', 'Crown Heights', 'Upper East Side'])
+
+ROOM_PRICE = np.array([80.0, 30.0, 0.0])
+NEIGHBOURHOOD_GROUP_PRICE = np.array([60.0, 30.0, 0.0, 0.0, 0.0])
+
 def generate_realistic_nyc_airbnb_data(n_samples=4000):
     """Generate realistic NYC Airbnb dataset for training"""
 
-    data = {
+    room_code = np.random.choice(3, n_samples, p=[0.5, 0.45, 0.05])
+    ng_code = np.random.choice(5, n_samples, p=[0.40, 0.32, 0.18, 0.07, 0.03])
+
+    host_listings_p = np.exp(-np.arange(50) / 10)
+    host_listings_p /= host_listings_p.sum()
+
+    number_of_reviews = np.random.exponential(scale=15, size=n_samples).astype(int)
+    reviews_per_month = np.random.exponential(scale=1.5, size=n_samples)
+    availability_365 = np.random.uniform(0, 365, n_samples)
+
+    price = (
+        100.0
+        + ROOM_PRICE[room_code]
+        + NEIGHBOURHOOD_GROUP_PRICE[ng_code]
+        + number_of_reviews * 0.5
+        + reviews_per_month * 10
+        - availability_365 * 0.05
+        + np.random.normal(0, 20, n_samples)
+    )
+
+    high_demand = (
+        ((availability_365 < 100) & (number_of_reviews > 10)) |
+        ((reviews_per_month > 2) & (ng_code == 0))
+    ).astype(int)
+
+    df = pd.DataFrame({
         'latitude': np.random.uniform(40.58, 40.92, n_samples),
         'longitude': np.random.uniform(-74.29, -73.70, n_samples),
-        'room_type': np.random.choice(['Entire home/apt', 'Private room', 'Shared room'], n_samples, p=[0.5, 0.45, 0.05]),
-        'neighbourhood_group': np.random.choice(['Manhattan', 'Brooklyn', 'Queens', 'Bronx', 'Staten Island'], n_samples, p=[0.40, 0.32, 0.18, 0.07, 0.03]),
-        'neighbourhood': np.random.choice(['Harlem', 'Williamsburg', 'Upper West Side', 'Bedford-Stuyvesant', 'East Village', 'Brooklyn Heights', 'Astoria', 'Bushwick', 'Crown Heights', 'Upper East Side'], n_samples),
+        'room_type': ROOM_NAMES[room_code],
+        'neighbourhood_group': NEIGHBOURHOOD_GROUP_NAMES[ng_code],
+        'neighbourhood': np.random.choice(NEIGHBOURHOOD_NAMES, n_samples),
         'minimum_nights': np.random.choice([1, 2, 3, 7, 30, 90], n_samples, p=[0.40, 0.20, 0.15, 0.15, 0.07, 0.03]),
-        'number_of_reviews': np.random.exponential(scale=15, size=n_samples).astype(int),
-        'reviews_per_month': np.random.exponential(scale=1.5, size=n_samples),
-        'calculated_host_listings_count': np.random.choice(range(1, 50), n_samples, p=np.exp(-np.arange(50)/10)/np.sum(np.exp(-np.arange(50)/10))),
-        'availability_365': np.random.uniform(0, 365, n_samples),
-    }
+        'number_of_reviews': number_of_reviews,
+        'reviews_per_month': reviews_per_month,
+        'calculated_host_listings_count': np.random.choice(np.arange(1, 51), n_samples, p=host_listings_p),
+        'availability_365': availability_365,
+    })
 
-    df = pd.DataFrame(data)
-
-    price = 100
-    price += np.where(df['room_type'] == 'Entire home/apt', 80, 0)
-    price += np.where(df['room_type'] == 'Private room', 30, 0)
-    price += np.where(df['neighbourhood_group'] == 'Manhattan', 60, 0)
-    price += np.where(df['neighbourhood_group'] == 'Brooklyn', 30, 0)
-    price += df['number_of_reviews'] * 0.5
-    price += df['reviews_per_month'] * 10
-    price -= df['availability_365'] * 0.05
-    price += np.random.normal(0, 20, n_samples)
     df['price'] = np.maximum(10, price)
-
-    df['high_demand'] = (
-        ((df['availability_365'] < 100) & (df['number_of_reviews'] > 10)).astype(int) |
-        ((df['reviews_per_month'] > 2) & (df['neighbourhood_group'] == 'Manhattan')).astype(int)
-    )
+    df['high_demand'] = high_demand
 
     return df
 
+@njit(parallel=True, cache=True)
+def _engineer_numeric(avail, n_rev, rpm, min_nights, out_avail_ratio, out_rev_density, out_min_ratio):
+    """Compute the derived numeric features in one parallel pass"""
+    for i in prange(avail.size):
+        out_avail_ratio[i] = avail[i] / 365.0
+        out_rev_density[i] = 0.0 if n_rev[i] == 0 else rpm[i] / n_rev[i]
+        out_min_ratio[i] = min_nights[i] / 365.0
+
 def engineer_features(df):
     """Engineer features for modeling"""
 
     df = df.copy()
 
-    df['availability_ratio'] = df['availability_365'] / 365
-    df['reviews_density'] = np.where(df['number_of_reviews'] > 0, df['reviews_per_month'] / df['number_of_reviews'], 0)
-    df['min_nights_ratio'] = df['minimum_nights'] / 365
+    n = len(df)
+    availability_ratio = np.empty(n)
+    reviews_density = np.empty(n)
+    min_nights_ratio = np.empty(n)
+    _engineer_numeric(
+        df['availability_365'].values,
+        df['number_of_reviews'].values,
+        df['reviews_per_month'].values,
+        df['minimum_nights'].values,
+        availability_ratio, reviews_density, min_nights_ratio,
+    )
 
-    room_type_dummies = pd.get_dummies(df['room_type'], prefix='room_type')
-    neighbourhood_group_dummies = pd.get_dummies(df['neighbourhood_group'], prefix='neighbourhood_group')
+    df['availability_ratio'] = availability_ratio
+    df['reviews_density'] = reviews_density
+    df['min_nights_ratio'] = min_nights_ratio
 
     neighbourhood_freq = df['neighbourhood'].value_counts(normalize=True).to_dict()
     df['neighbourhood_encoded'] = df['neighbourhood'].map(neighbourhood_freq)
 
-    df = pd.concat([df, room_type_dummies, neighbourhood_group_dummies], axis=1)
+    for cat in ('Entire home/apt', 'Private room', 'Shared room'):
+        df[f'room_type_{cat}'] = (df['room_type'].values == cat).astype(np.uint8)
+
+    for cat in ('Bronx', 'Brooklyn', 'Manhattan', 'Queens', 'Staten Island'):
+        df[f'neighbourhood_group_{cat}'] = (df['neighbourhood_group'].values == cat).astype(np.uint8)
+
+    df = df.drop(columns=['room_type', 'neighbourhood_group'])
 
     return df
 
@@ -70,23 +111,34 @@ def train_price_model(X_train, y_train, X_val, y_val):
 
     print("Training Random Forest Price Prediction Model...")
 
-    model = RandomForestRegressor(
-        n_estimators=200,
-        max_depth=25,
-        min_samples_split=5,
-        min_samples_leaf=2,
-        random_state=42,
-        n_jobs=-1,
-        verbose=1
-    )
+    candidates = []
+    for max_depth in (12, 15, 18):
+        candidate = RandomForestRegressor(
+            n_estimators=200,
+            max_depth=max_depth,
+            min_samples_split=5,
+            min_samples_leaf=10,
+            random_state=42,
+            n_jobs=-1,
+        )
+        candidate.fit(X_train, y_train)
+        candidates.append((max_depth, candidate, candidate.score(X_val, y_val)))
+        print(f"   max_depth={max_depth}: Val R² {candidates[-1][2]:.4f}")
+
+    best_val = max(score for _, _, score in candidates)
+    max_depth, model, _ = next(c for c in candidates if c[2] >= best_val - 0.01 * abs(best_val))
+    print(f"   Selected max_depth={max_depth} (shallowest within 1% of best Val R²)")
+
+    from sklearn.metrics import r2_score, mean_squared_error
 
-    model.fit(X_train, y_train)
+    train_pred = model.predict(X_train)
+    val_pred = model.predict(X_val)
 
-    train_score = model.score(X_train, y_train)
-    val_score = model.score(X_val, y_val)
+    train_score = r2_score(y_train, train_pred)
+    val_score = r2_score(y_val, val_pred)
 
-    train_rmse = np.sqrt(np.mean((model.predict(X_train) - y_train) ** 2))
-    val_rmse = np.sqrt(np.mean((model.predict(X_val) - y_val) ** 2))
+    train_rmse = mean_squared_error(y_train, train_pred, squared=False)
+    val_rmse = mean_squared_error(y_val, val_pred, squared=False)
 
     print(f"Price Model - Train R²: {train_score:.4f}, Val R²: {val_score:.4f}")
     print(f"Price Model - Train RMSE: ${train_rmse:.2f}, Val RMSE: ${val_rmse:.2f}")
@@ -97,6 +149,7 @@ def train_price_model(X_train, y_train, X_val, y_val):
         'train_rmse': float(train_rmse),
         'val_rmse': float(val_rmse),
         'model_type': 'RandomForestRegressor',
+        'max_depth': max_depth,
         'n_features': len(X_train.columns),
     }
 
@@ -161,6 +214,25 @@ def train_demand_model(X_train, y_train, X_val, y_val):
 
     return model, metrics, feature_importance
 
+def write_feature_schema(feature_columns, neighbourhood_freq, path='ml_models/models/feature_schema.py'):
+    """Write feature columns and frequency maps as an importable constants module"""
+
+    lines = ['"""Feature schema generated by ml_models/train_models.py. Do not edit by hand."""', '']
+
+    lines.append('FEATURE_COLUMNS = [')
+    for col in feature_columns:
+        lines.append(f'    {col!r},')
+    lines.append(']')
+
+    lines.append('')
+    lines.append('NEIGHBOURHOOD_FREQ = {')
+    for name, freq in sorted(neighbourhood_freq.items()):
+        lines.append(f'    {name!r}: {freq!r},')
+    lines.append('}')
+
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
 def main():
     """Main training pipeline"""
 
@@ -182,21 +254,20 @@ def main():
     feature_cols = [col for col in df.columns if col not in ['price', 'high_demand', 'neighbourhood']]
 
     print("\n3. Splitting data...")
-    X_train, X_test, y_price_train, y_price_test = train_test_split(
-        df[feature_cols], df['price'], test_size=0.2, random_state=42
-    )
+    idx_trainval, idx_test = train_test_split(np.arange(len(df)), test_size=0.2, random_state=42)
+    idx_train, idx_val = train_test_split(idx_trainval, test_size=0.2, random_state=42)
 
-    _, _, y_demand_train, y_demand_test = train_test_split(
-        df[feature_cols], df['high_demand'], test_size=0.2, random_state=42
-    )
+    X_train = df[feature_cols].iloc[idx_train]
+    X_val = df[feature_cols].iloc[idx_val]
+    X_test = df[feature_cols].iloc[idx_test]
 
-    X_train, X_val, y_price_train, y_price_val = train_test_split(
-        X_train, y_price_train, test_size=0.2, random_state=42
-    )
+    y_price_train = df['price'].iloc[idx_train]
+    y_price_val = df['price'].iloc[idx_val]
+    y_price_test = df['price'].iloc[idx_test]
 
-    _, _, y_demand_train, y_demand_val = train_test_split(
-        X_train, y_demand_train, test_size=0.2, random_state=42
-    )
+    y_demand_train = df['high_demand'].iloc[idx_train]
+    y_demand_val = df['high_demand'].iloc[idx_val]
+    y_demand_test = df['high_demand'].iloc[idx_test]
 
     print(f"   Train size: {len(X_train)}, Val size: {len(X_val)}, Test size: {len(X_test)}")
 
@@ -205,9 +276,10 @@ def main():
         X_train, y_price_train, X_val, y_price_val
     )
 
+    from sklearn.metrics import r2_score, mean_squared_error
     test_price_pred = price_model.predict(X_test)
-    test_price_rmse = np.sqrt(np.mean((test_price_pred - y_price_test) ** 2))
-    test_price_r2 = price_model.score(X_test, y_price_test)
+    test_price_rmse = mean_squared_error(y_price_test, test_price_pred, squared=False)
+    test_price_r2 = r2_score(y_price_test, test_price_pred)
     print(f"   Test R²: {test_price_r2:.4f}, Test RMSE: ${test_price_rmse:.2f}")
 
     print("\n5. Training demand classification model...")
@@ -223,11 +295,30 @@ def main():
     print("\n6. Saving models...")
     joblib.dump(price_model, 'ml_models/models/price_model.joblib')
     joblib.dump(demand_model, 'ml_models/models/demand_model.pkl')
+    demand_model.save_model('ml_models/models/demand_model.txt', num_iteration=demand_model.best_iteration)
     joblib.dump(X_train.columns.tolist(), 'ml_models/models/feature_columns.joblib')
+    write_feature_schema(X_train.columns.tolist(), df['neighbourhood'].value_counts(normalize=True).to_dict())
 
     print("   ✓ Price model saved to ml_models/models/price_model.joblib")
     print("   ✓ Demand model saved to ml_models/models/demand_model.pkl")
+    print("   ✓ Demand model saved to ml_models/models/demand_model.txt (native format)")
     print("   ✓ Feature columns saved")
+    print("   ✓ Feature schema saved to ml_models/models/feature_schema.py")
+
+    try:
+        import treelite
+        import treelite.sklearn
+
+        tl_model = treelite.sklearn.import_model(price_model)
+        tl_model.export_lib(
+            toolchain='gcc',
+            libpath='ml_models/models/price_model.so',
+            params={'parallel_comp': 8, 'quantize': 1},
+            verbose=False,
+        )
+        print("   ✓ Compiled price model saved to ml_models/models/price_model.so")
+    except Exception as e:
+        print(f"   ! Treelite export skipped ({e}), backend will fall back to joblib")
 
     print("\n7. Saving metadata...")
     metadata = {
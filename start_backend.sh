@@ -8,5 +8,5 @@ echo "Training ML models..."
 python ml_models/train_models.py
 
 echo ""
-echo "Starting Flask backend server..."
-python backend/app.py
+echo "Starting backend server (gunicorn, preloaded models)..."
+gunicorn -w "$(nproc)" --preload --worker-class=sync --timeout 30 --bind 0.0.0.0:5000 backend.wsgi:app